@@ -32,131 +32,249 @@
 #-------------------------------------------------------------------------------
 # Import
 #-------------------------------------------------------------------------------
-import argparse
 import re
+from collections import defaultdict
+from functools import reduce
+from itertools import chain
+from operator import and_
+from sys import intern, stderr
 from vagen import If, While, Bool, HiLevelMod, At, Fatal, Branch, \
-                  Above, Cross, CmdList, Strobe, hilevelmod
-from tatsu import compile
+                  Cross, CmdList, Strobe, VagenError
 
 
 #-------------------------------------------------------------------------------
-## Parser Grammar
+## Lexical patterns of the .g format
 #
 #-------------------------------------------------------------------------------
-GRAMMAR = '''
+_NAME  = r'[a-zA-Z_][a-zA-Z_0-9]*'
 
+_VALUE = r'[0-9]+'
 
-    @@grammar::Calc
+_TP    = rf'{_NAME}[\+\-\~]?(?:/{_VALUE})?'
 
-    @@whitespace::/[\t ]+/
+_DIRECTIVE_RE = re.compile(r'\.[a-zA-Z]+')
 
-    @@eol_comments :: /#[^\n]*\n/
+_NAME_RE = re.compile(_NAME)
 
-    start   = stg $ ;
+_TP_RE = re.compile(_TP)
 
-    stg     = {'\\n'}* '.model' name:name {'\\n'}+ 
-              {input+:inputs        |  
-               output+:outputs      | 
-               internal+:internals  | 
-               dummy+:dummy         |
-               graph+:graph         |
-               marking+:marking     |
-               capacity+:capacity}* 
-              '.end' {'\\n'}*; 
+_UNIQUE_RE = re.compile(rf'[\t ]*(?:<[\t ]*({_TP},{_TP})[\t ]*>|({_NAME}))'
+                        rf'(?:[\t ]*=[\t ]*({_VALUE}))?')
 
-    inputs    = '.inputs'  {@+:name}+ {'\\n'}+;
+_SIGNAL_SECTIONS = {'.inputs'   : 'input',
+                    '.outputs'  : 'output',
+                    '.internal' : 'internal',
+                    '.dummy'    : 'dummy'}
 
-    outputs   = '.outputs' {@+:name}+ {'\\n'}+;
 
-    internals = '.internal' {@+:name}+ {'\\n'}+;
-
-    dummy     = '.dummy'   {@+:name}+ {'\\n'}+;
-
-    graph     = '.graph'   {'\\n'}+ {@+:tpLine}+ {'\\n'}*;
-
-    tpLine    = {@+:tranPlace}+ {'\\n'}+;
-
-    marking   = '.marking'  '{' {@+:unique}+ '}' {'\\n'}+;
-
-    capacity  = '.capacity' {@+:unique}+ {'\\n'};
-
-    unique    = implicit | explicit;
-
-    explicit  = @+:name ['=' @+:value];
- 
-    implicit  = '<' @+:tranPlaceComma '>' ['=' @+:value];
-     
-    name      = /[a-zA-Z_][a-zA-Z_0-9]*/;
+#-------------------------------------------------------------------------------
+## Parse a list of markings or capacities (e.g. "p0 <a+,b-> p1=2")
+#
+#  @param text string containing the list
+#  @param lineNumber line of the .g file where the list was declared
+#  @return list where each element is [place] or [place, value]. Implicit 
+#          places are represented by the "transition,transition" string
+#
+#-------------------------------------------------------------------------------
+def parseUniques(text, lineNumber):
+    uniques = []
+    text = text.rstrip()
+    pos = 0
+    while pos < len(text):
+        m = _UNIQUE_RE.match(text, pos)
+        if m is None:
+            raise ValueError(f"Line {lineNumber}: unable to parse "
+                             f"'{text[pos:].strip()}'")
+        unique = [item for item in m.groups() if item is not None]
+        unique[0] = intern(unique[0])
+        uniques.append(unique)
+        pos = m.end()
+    if len(uniques) == 0:
+        raise ValueError(f"Line {lineNumber}: empty list")
+    return uniques
 
-    value     = /[0-9]+/;
 
-    tranPlace = ?/[a-zA-Z_][a-zA-Z_0-9\+\-\~/]*/?;
+#-------------------------------------------------------------------------------
+## Parse the .model declaration
+#
+#  @param ast dictionary representing the stg
+#  @param keyword directive of the declaration
+#  @param body remaining of the line after the directive
+#  @param lineNumber line of the .g file where the directive was found
+#
+#-------------------------------------------------------------------------------
+def parseModel(ast, keyword, body, lineNumber):
+    if 'name' in ast:
+        raise ValueError(f"Line {lineNumber}: duplicated .model")
+    name = body.split()
+    if len(name) != 1 or not _NAME_RE.fullmatch(name[0]):
+        raise ValueError(f"Line {lineNumber}: invalid model name '{body}'")
+    ast['name'] = name[0]
 
-    tranPlaceComma = ?/[a-zA-Z_][a-zA-Z_0-9\+\-\~/]*,[a-zA-Z_][a-zA-Z_0-9\+\-\~/]*/?;
 
-'''
+#-------------------------------------------------------------------------------
+## Parse the .inputs, .outputs, .internal and .dummy declarations
+#
+#  @param ast dictionary representing the stg
+#  @param keyword directive of the declaration
+#  @param body remaining of the line after the directive
+#  @param lineNumber line of the .g file where the directive was found
+#
+#-------------------------------------------------------------------------------
+def parseSignals(ast, keyword, body, lineNumber):
+    signals = [intern(signal) for signal in body.split()]
+    if len(signals) == 0:
+        raise ValueError(f"Line {lineNumber}: {keyword} without signals")
+    for signal in signals:
+        if not _NAME_RE.fullmatch(signal):
+            raise ValueError(f"Line {lineNumber}: invalid signal name {signal}")
+    ast.setdefault(_SIGNAL_SECTIONS[keyword], []).append(signals)
 
 
 #-------------------------------------------------------------------------------
-## Asserts that string is a str. Raise an error otherwise
+## Parse the .graph declaration
 #
-#  @param string input to be checked
+#  @param ast dictionary representing the stg
+#  @param keyword directive of the declaration
+#  @param body remaining of the line after the directive
+#  @param lineNumber line of the .g file where the directive was found
+#  @return list that will receive the arrows of the graph
 #
 #-------------------------------------------------------------------------------
-def assertStr(string):
-    assert isinstance(string, str), f"{string} must be a string" 
+def parseGraph(ast, keyword, body, lineNumber):
+    if body:
+        raise ValueError(f"Line {lineNumber}: unexpected '{body}' after .graph")
+    graph = []
+    ast.setdefault('graph', []).append(graph)
+    return graph
 
 
 #-------------------------------------------------------------------------------
-## Asserts that listInst is a list. Raise an error otherwise
+## Parse the .marking declaration
 #
-#  @param listInst input to be checked
+#  @param ast dictionary representing the stg
+#  @param keyword directive of the declaration
+#  @param body remaining of the line after the directive
+#  @param lineNumber line of the .g file where the directive was found
 #
 #-------------------------------------------------------------------------------
-def assertList(listInst):
-    assert isinstance(listInst, list), f"{listInst} must be a list" 
+def parseMarking(ast, keyword, body, lineNumber):
+    if not (body.startswith('{') and body.endswith('}')):
+        raise ValueError(f"Line {lineNumber}: marking must be enclosed by "
+                         f"braces")
+    ast.setdefault('marking', []).append(parseUniques(body[1:-1], lineNumber))
 
 
 #-------------------------------------------------------------------------------
-## Asserts that integer is a int. Raise an error otherwise
+## Parse the .capacity declaration
 #
-#  @param integer input to be checked
+#  @param ast dictionary representing the stg
+#  @param keyword directive of the declaration
+#  @param body remaining of the line after the directive
+#  @param lineNumber line of the .g file where the directive was found
 #
 #-------------------------------------------------------------------------------
-def assertInt(integer):
-    assert isinstance(integer, int), f"{integer} must be an integer" 
+def parseCapacity(ast, keyword, body, lineNumber):
+    ast.setdefault('capacity', []).append(parseUniques(body, lineNumber))
 
 
 #-------------------------------------------------------------------------------
-## Asserts that place is a Place. Raise an error otherwise
-#
-#  @param place input to be checked
+## Parser of each directive. The directive is the first token of a 
+#  declaration, so each line is dispatched to a single parser
 #
 #-------------------------------------------------------------------------------
-def assertPlace(place):
-    assert isinstance(place, Place), \
-           f"{place} must be an instance of the Place class" 
+_DIRECTIVES = {'.model'    : parseModel,
+               '.inputs'   : parseSignals,
+               '.outputs'  : parseSignals,
+               '.internal' : parseSignals,
+               '.dummy'    : parseSignals,
+               '.graph'    : parseGraph,
+               '.marking'  : parseMarking,
+               '.capacity' : parseCapacity}
 
 
 #-------------------------------------------------------------------------------
-## Asserts that transition is a Transition. Raise an error otherwise
+## Parse the content of a .g file
 #
-#  @param transition input to be checked
+#  @param content string with the content of the .g file or an iterable over
+#         its lines, such as the open file
+#  @return dictionary representing the stg. Each declaration is appended to
+#          the list of its section, e.g. {"name": "STG", "input": [["a"]], 
+#          "graph": [[["a+", "b+"], ["b+", "a-"]]], "marking": [[["p0"]]]}
 #
 #-------------------------------------------------------------------------------
-def assertTransition(transition):
-    assert isinstance(transition, Transition), \
-           f"{transition} must be an instance of the Transition class" 
+def parseSTG(content):
+    ast = {}
+    graph = None
+    ended = False
+    if isinstance(content, str):
+        content = content.splitlines()
+    for lineNumber, line in enumerate(content, 1):
+        line = line.split('#', 1)[0].strip()
+        if not line:
+            continue
+        if ended:
+            raise ValueError(f"Line {lineNumber}: unexpected content after "
+                             f".end")
+        directive = _DIRECTIVE_RE.match(line)
+
+        # Arrows of the graph
+        #-----------------------------------------------------------------------
+        if directive is None:
+            if graph is None:
+                raise ValueError(f"Line {lineNumber}: unexpected '{line}' "
+                                 f"outside .graph")
+            # Names repeat across arrows and are dictionary keys later on, so
+            # every occurrence shares one interned string
+            tpLine = [intern(tp) for tp in line.split()]
+            for tp in tpLine:
+                if not _TP_RE.fullmatch(tp):
+                    raise ValueError(f"Line {lineNumber}: invalid place or "
+                                     f"transition {tp}")
+            graph.append(tpLine)
+            continue
+
+        # Declarations
+        #-----------------------------------------------------------------------
+        keyword = directive.group()
+        body = line[directive.end():].strip()
+        if keyword == '.end':
+            if body:
+                raise ValueError(f"Line {lineNumber}: unexpected '{body}' "
+                                 f"after .end")
+            ended = True
+            continue
+        if not keyword in _DIRECTIVES:
+            raise ValueError(f"Line {lineNumber}: unknown directive {keyword}")
+        if keyword != '.model' and not 'name' in ast:
+            raise ValueError(f"Line {lineNumber}: {keyword} found before "
+                             f".model")
+        graph = _DIRECTIVES[keyword](ast, keyword, body, lineNumber)
+    if not 'name' in ast:
+        raise ValueError("No .model declaration was found")
+    if not ended:
+        raise ValueError("No .end declaration was found")
+    return ast
 
 
 #-------------------------------------------------------------------------------
-## Asserts that edge is a '-', '+' or '~'. Raise an error otherwise
+## Signal edges that complete each type of transition, as (rising, falling)
 #
-#  @param edge input to be checked
+#-------------------------------------------------------------------------------
+_EDGE_SIDES = {'+' : (True, False),
+               '-' : (False, True),
+               '~' : (True, True)}
+
+
+#-------------------------------------------------------------------------------
+## Translation table from place and transition names to verilogA identifiers
 #
 #-------------------------------------------------------------------------------
-def assertEdge(edge):
-    assert edge in ['-', '+', '~'], f"Unknown edge {edge}" 
+_VAR_NAME = str.maketrans({',' : '$$',
+                           '+' : '$p',
+                           '-' : '$m',
+                           '~' : '$t',
+                           '/' : '$'})
 
 
 #-------------------------------------------------------------------------------
@@ -165,6 +283,8 @@ def assertEdge(edge):
 #-------------------------------------------------------------------------------
 class Transition():
 
+    __slots__ = ('toPlaces', 'fromPlaces', 'var')
+
     #---------------------------------------------------------------------------
     ## Constructor
     #
@@ -185,7 +305,8 @@ class Transition():
     #
     #---------------------------------------------------------------------------
     def addTo(self, place):
-        assertPlace(place)
+        assert isinstance(place, Place), \
+               f"{place} must be an instance of the Place class"
         self.toPlaces.append(place)
     
     #---------------------------------------------------------------------------
@@ -196,7 +317,8 @@ class Transition():
     #
     #---------------------------------------------------------------------------
     def addFrom(self, place):
-        assertPlace(place)
+        assert isinstance(place, Place), \
+               f"{place} must be an instance of the Place class"
         self.fromPlaces.append(place)   
 
     #---------------------------------------------------------------------------
@@ -225,10 +347,8 @@ class Transition():
     #
     #---------------------------------------------------------------------------
     def isEnabled(self):
-        ans = True
-        for fromItem in self.getFrom():
-            ans = ans & fromItem.hasToken()
-        return ans    
+        return reduce(and_, (place.hasToken() for place in self.fromPlaces), 
+                      True)
         
     #---------------------------------------------------------------------------
     ## Is On going
@@ -249,10 +369,8 @@ class Transition():
     #
     #---------------------------------------------------------------------------
     def getTokens(self):
-        ans = CmdList(self.var.eq(True))
-        for fromItem in self.getFrom():
-            ans.append(fromItem.getToken())
-        return ans    
+        return CmdList(self.var.eq(True), 
+                       *[place.getToken() for place in self.fromPlaces])
         
     #---------------------------------------------------------------------------
     ## put all the tokens in the destination places
@@ -262,10 +380,8 @@ class Transition():
     #
     #---------------------------------------------------------------------------
     def putTokens(self):
-        ans = CmdList(self.var.eq(False))
-        for toItem in self.getTo():
-            ans.append(toItem.putToken())
-        return ans   
+        return CmdList(self.var.eq(False), 
+                       *[place.putToken() for place in self.toPlaces])
         
     #---------------------------------------------------------------------------
     ## Fire up the transition imediatelly
@@ -275,12 +391,8 @@ class Transition():
     #
     #---------------------------------------------------------------------------
     def fire(self):
-        ans = CmdList()
-        for fromItem in self.getFrom():
-            ans.append(fromItem.getToken())
-        for toItem in self.getTo():
-            ans.append(toItem.putToken())
-        return ans   
+        return CmdList(*[place.getToken() for place in self.fromPlaces],
+                       *[place.putToken() for place in self.toPlaces])
 
 
 #-------------------------------------------------------------------------------
@@ -288,6 +400,9 @@ class Transition():
 #
 #-------------------------------------------------------------------------------
 class Place():
+
+    __slots__ = ('capacity', 'toTransitions', 'fromTransitions', 'var', 
+                 'name', 'errVar')
     
     #---------------------------------------------------------------------------
     ## Constructor
@@ -299,7 +414,7 @@ class Place():
     #
     #---------------------------------------------------------------------------
     def __init__(self, var, errVar, name, capacity = 1):
-        assertInt(capacity)
+        assert isinstance(capacity, int), f"{capacity} must be an integer"
         self.capacity = capacity
         self.toTransitions = []
         self.fromTransitions = []
@@ -352,7 +467,8 @@ class Place():
     #
     #---------------------------------------------------------------------------
     def addTo(self, transition):
-        assertTransition(transition)
+        assert isinstance(transition, Transition), \
+               f"{transition} must be an instance of the Transition class"
         self.toTransitions.append(transition)
     
     #---------------------------------------------------------------------------
@@ -363,7 +479,8 @@ class Place():
     #
     #---------------------------------------------------------------------------
     def addFrom(self, transition):
-        assertTransition(transition)
+        assert isinstance(transition, Transition), \
+               f"{transition} must be an instance of the Transition class"
         self.fromTransitions.append(transition)
 
     #---------------------------------------------------------------------------
@@ -397,8 +514,8 @@ class STG():
     ## Constructor
     #
     #  @param ast abstract syntax tree representing the petri net (parsed from 
-    #      .g file by the tatsu with the grammar defined by GRAMMAR). However, 
-    #      any list respecting the same format is also valid
+    #      .g file by parseSTG). However, any dictionary respecting the same 
+    #      format is also valid
     #
     #---------------------------------------------------------------------------
     def __init__(self, 
@@ -417,6 +534,8 @@ class STG():
         self.markings    = {}
         self.capacity    = {}
         self.dummies     = []
+        self.inputs      = set()
+        self.tpCache     = {}
         sigMap['dummy'] = 'dummy'
         
         # verilogA module
@@ -436,14 +555,20 @@ class STG():
                        gnd = self.gnd,
                        inCap = self.inCap,
                    )
-        self.rstAt = CmdList()
+        self.rstAt = []
+        rstCmds = CmdList()
         self.mod.analog(
             At( Cross(self.rst.diffHalfDomain, "both") )(),
             If( ~self.rst.read() )(
-                self.rstAt
+                rstCmds
             )
         )
         self.done = self.mod.var(value = 0, name = "_$done")
+        # The updates of the done counter are shared by every block that uses
+        # them. Nothing modifies a vagen command once it is built, so the
+        # same objects can be rendered in several places
+        self.doneClear = self.done.eq(0)
+        self.doneInc = self.done.inc()
         self.iter = self.mod.var(value = 0, name = "_$counter")
 
         if seeError:
@@ -460,101 +585,91 @@ class STG():
        
         # Read all signals
         #-----------------------------------------------------------------------
+        seen = set()
         for sigType in ["output", "input", "internal", "dummy"]:
-            if sigType in ast:
-                for signalList in ast[sigType]:
-                    assertList(signalList)
-                    for signal in signalList:
-                        assertStr(signal)
-                        if sigMap[sigType] == "input" or \
-                           sigMap[sigType] == "output":
-                            assert not signal in self.signals, \
-                                   f"Duplicated signal {signal}"
-                            par = 0
-                            if sigMap[sigType] == "output":
-                                par = self.mod.par(0, f"{signal}_RST_VALUE_PAR")
-                            digpin = self.mod.dig(
-                                         domain = self.vdd, 
-                                         name = signal,
-                                         value = par,
-                                         direction = sigMap[sigType],
-                                         delay = self.dl,
-                                         rise = self.rf,
-                                         fall = self.rf,
-                                         gnd = self.gnd,
-                                         inCap = self.inCap,
-                                         serRes = self.serRes
-                                     )
-                            if sigMap[sigType] == "output":
-                                self.rstAt.append(digpin.write(Bool(par)))
-                            self.signals[signal] = digpin     
-                            self.transitions[signal] = {"+":{}, "-":{}, "~":{}}
+            kind = sigMap[sigType]
+            isPin = kind == "input" or kind == "output"
+            isOutput = kind == "output"
+            pinArgs = dict(domain = self.vdd, 
+                           direction = kind,
+                           delay = self.dl,
+                           rise = self.rf,
+                           fall = self.rf,
+                           gnd = self.gnd,
+                           inCap = self.inCap,
+                           serRes = self.serRes)
+            for signalList in ast.get(sigType, []):
+                for signal in signalList:
+                    if signal in seen:
+                        raise ValueError(f"Duplicated signal {signal}")
+                    seen.add(signal)
+                    if isPin:
+                        par = 0
+                        if isOutput:
+                            par = self.mod.par(0, f"{signal}_RST_VALUE_PAR")
+                        digpin = self.mod.dig(name = signal, 
+                                              value = par, 
+                                              **pinArgs)
+                        if isOutput:
+                            self.rstAt.append(digpin.write(Bool(par)))
                         else:
-                            self.dummies.append(signal)
-                            self.transitions[signal] = {}     
-                                             
+                            self.inputs.add(signal)
+                        self.signals[signal] = digpin     
+                        self.transitions[signal] = defaultdict(dict)
+                    else:
+                        self.dummies.append(signal)
+                        self.transitions[signal] = {}     
                     
         # Assert presence of inputs and outputs.
         #-----------------------------------------------------------------------                                   
-        assert len(self.signals) > 0, \
-               " There is no input or output signals. Odd.."
+        if len(self.signals) == 0:
+            raise ValueError(" There is no input or output signals. Odd..")
 
         # Read capacity
         #-----------------------------------------------------------------------
-        if "capacity" in ast:
-            for capList in ast["capacity"]:
-                assertList(capList)
-                for cap in capList:
-                    cap = list(cap)
-                    assert len(cap) == 2, \
-                           f"{cap} capacity list must have two elements"
-                    assertStr(cap[0])
-                    assert not cap[0] in self.capacity.keys(), \
-                           f"Duplicated capacity for signal {cap[0]}"
-                    self.capacity[cap[0]] = int(cap[1]) 
+        for cap in chain.from_iterable(ast.get("capacity", [])):
+            cap = list(cap)
+            if len(cap) != 2:
+                raise ValueError(f"{cap} capacity list must have two elements")
+            if cap[0] in self.capacity:
+                raise ValueError(f"Duplicated capacity for signal {cap[0]}")
+            self.capacity[cap[0]] = int(cap[1]) 
 
         # Read markings
         #-----------------------------------------------------------------------
-        if "marking" in ast:
-            for markList in ast["marking"]:
-                assertList(markList)
-                for mark in markList:
-                    mark = list(mark)
-                    assert len(mark) == 2 or len(mark) == 1, \
-                           f"{mark} marking list must have one or two elements"
-                    assertStr(mark[0])
-                    assert not mark[0] in self.markings.keys(), \
-                           f"Duplicated marking for signal {mark[0]}"
-                    if len(mark) < 2:
-                        mark.append(1) 
-                    self.markings[mark[0]] = int(mark[1]) 
+        for mark in chain.from_iterable(ast.get("marking", [])):
+            mark = list(mark)
+            if len(mark) != 2 and len(mark) != 1:
+                raise ValueError(f"{mark} marking list must have one or two "
+                                 "elements")
+            if mark[0] in self.markings:
+                raise ValueError(f"Duplicated marking for signal {mark[0]}")
+            if len(mark) < 2:
+                mark.append(1) 
+            self.markings[mark[0]] = int(mark[1]) 
 
         # Read Graph
         #-----------------------------------------------------------------------
-        assert 'graph' in ast, "No graph declaration was found"
-        arrows  = []
-        for arrowList in ast["graph"]:
-            assertList(arrowList)
-            arrows = arrows + arrowList
-        assert len(arrows) > 0, \
-               " There is no arrows. Odd..."
-        for arrow in arrows:
-            assertList(arrow)
+        if not 'graph' in ast:
+            raise ValueError("No graph declaration was found")
+        if not any(ast["graph"]):
+            raise ValueError(" There is no arrows. Odd...")
+        matchTP = self.matchTP
+        matchPlace = self.matchPlace
+        for arrow in chain.from_iterable(ast["graph"]):
             #Read the left side of the arrow
             fromName = arrow[0]
-            fromTP = self.matchTP(fromName)
+            fromTP = matchTP(fromName)
             #Read the remaining elements of the list
             for toName in arrow[1:]:
-                toTP = self.matchTP(toName)   
-                assert not (isinstance(toTP, Place) and \
-                            isinstance(fromTP, Place)), \
-                     (f"There can't be arrow from place {fromTPName} to place "
-                      f"{toTPName}")
+                toTP = matchTP(toName)   
+                if isinstance(toTP, Place) and isinstance(fromTP, Place):
+                    raise ValueError(f"There can't be arrow from place "
+                                     f"{fromName} to place {toName}")
                 #Check if there is an implicit place
                 if isinstance(toTP, Transition) and \
                    isinstance(fromTP, Transition):
-                   impName = fromName + "," + toName
-                   impPlace = self.matchPlace(impName)
+                   impPlace = matchPlace(f"{fromName},{toName}")
                    fromTP.addTo(impPlace)
                    toTP.addFrom(impPlace)
                    impPlace.addFrom(fromTP)
@@ -563,157 +678,84 @@ class STG():
                 else:
                    fromTP.addTo(toTP)
                    toTP.addFrom(fromTP)
+
+        # The reset statements of pins, places and transitions are gathered 
+        # in a plain list while the graph is read and handed over at once
+        #-----------------------------------------------------------------------
+        rstCmds.append(*self.rstAt)
                   
         # build stg
         #-----------------------------------------------------------------------   
-        cmdOut = CmdList()    
+        cmdOut = []
         for dummy in self.dummies:
-            for transition in self.transitions[dummy]:
-                transitionObj = self.transitions[dummy][transition]
+            for transitionObj in self.transitions[dummy].values():
                 cmdOut.append(
                     If(transitionObj.isEnabled())( 
                         transitionObj.fire(),
-                        self.done.eq(0)
+                        self.doneClear
                     )  
                 )                    
                              
-        for signal in self.signals:
-            signalObj = self.signals[signal]
+        # The stg only evolves when it is out of reset and powered up
+        rstGuard = self.rst.read() & (Branch(self.vdd, self.gnd).v > 0.05)
+        for signal, signalObj in self.signals.items():
             
-            # Process signals
+            # Process signals. The commands of each edge are gathered in a list
+            # and the edge blocks are built once they are complete
             #-------------------------------------------------------------------
-            sigIfRising  = If(self.rst.read() & 
-                              (Branch(self.vdd, self.gnd).v > 0.05))(
-                               self.done.eq(0)
-                           )
-            sigIfFalling = If(self.rst.read() & 
-                              (Branch(self.vdd, self.gnd).v > 0.05))(
-                               self.done.eq(0)
-                           )
+            rising  = []
+            falling = []
+            halfDomain = signalObj.diffHalfDomain
+            if not signal in self.inputs: 
+                self.buildOutput(signal, signalObj, rising, falling, cmdOut)
+            else:
+                self.buildInput(signal, rising, falling)
             self.mod.analog(
-                At(Cross(signalObj.diffHalfDomain, "rising"))(
-                    sigIfRising
+                At(Cross(halfDomain, "rising"))(
+                    If(rstGuard)(
+                        self.doneClear,
+                        *rising,
+                        If(self.done == 0)(
+                            Strobe(f"No transitions related to {signal}+ are "
+                                   f"enabled"),
+                            self.errVar.eq(True)
+                        ),  
+                        If(self.done > 1)(
+                            Strobe(f"More than one transition fires for "
+                                   f"{signal}+"),
+                            self.errVar.eq(True)
+                        )  
+                    )
                 ),
-                At(Cross(signalObj.diffHalfDomain, "falling"))(
-                    sigIfFalling
+                At(Cross(halfDomain, "falling"))(
+                    If(rstGuard)(
+                        self.doneClear,
+                        *falling,
+                        If(self.done == 0)(
+                            Strobe(f"No transitions related to {signal}- are "
+                                   f"enabled"),
+                            self.errVar.eq(True)
+                        ),
+                        If(self.done > 1)(
+                            Strobe(f"More than one transition fires for "
+                                   f"{signal}-"),
+                            self.errVar.eq(True)
+                        )  
+                    )
                 )
-            )   
-
-            if not isinstance(signalObj, hilevelmod.DigIn): 
-                for edge in ['+', '-', '~']:  
-                    for transition in self.transitions[signal][edge].keys():     
-                        transitionObj = self.transitions[signal][edge][transition]
-                        if edge == '+':
-                            sigIfRising.append(True,
-                                If(transitionObj.isOnGoing())(
-                                    transitionObj.putTokens(), 
-                                    self.done.inc()       
-                                ),
-                            )  
-                            cmdOut.append(
-                                If(transitionObj.isEnabled())( 
-                                    transitionObj.getTokens(),
-                                    If(signalObj.getST())(
-                                        Strobe( (f"{transition} failed to trigger "
-                                                 f"because {signal} is already "
-                                                  "high") ),
-                                        self.errVar.eq(True)
-                                    ).Else(
-                                        signalObj.write(True)
-                                    ),
-                                    self.done.eq(0)
-                                )  
-                            )
-                        elif edge == '-':
-                            sigIfFalling.append(True,
-                                If(transitionObj.isOnGoing())(
-                                    transitionObj.putTokens(), 
-                                    self.done.inc()       
-                                ),
-                            ) 
-                            cmdOut.append(
-                                If(transitionObj.isEnabled())( 
-                                    transitionObj.getTokens(),
-                                    If(signalObj.getST())(
-                                        signalObj.write(False)
-                                    ).Else(
-                                        Strobe( (f"{transition} failed to trigger "
-                                                 f"because {signal} is already "
-                                                  "low") ),
-                                        self.errVar.eq(True)
-                                    ),
-                                    self.done.eq(0) 
-                                )  
-                            )
-                        else:
-                            sigIfRising.append(True,
-                                If(transitionObj.isOnGoing())(
-                                    transitionObj.putTokens(), 
-                                    self.done.inc()       
-                                ),
-                            ) 
-                            sigIfFalling.append(True,
-                                If(transitionObj.isOnGoing())(
-                                    transitionObj.putTokens(), 
-                                    self.done.inc()       
-                                ),
-                            ) 
-                            cmdOut.append(
-                                If(transitionObj.isEnabled())( 
-                                    transitionObj.getTokens(),
-                                    signalObj.toggle(),
-                                    self.done.eq(0) 
-                                )  
-                            )
-            else:
-                for edge in ['+', '-', '~']:  
-                    for transition in self.transitions[signal][edge].keys():    
-                        transitionObj = self.transitions[signal][edge][transition] 
-                        if edge in ['+', '~']:
-                            sigIfRising.append(True,
-                                If(transitionObj.isEnabled())(
-                                    transitionObj.fire(), 
-                                    self.done.inc()       
-                                ),
-                            )  
-                        if edge in ['-', '~']:
-                            sigIfFalling.append(True,
-                                If(transitionObj.isEnabled())(
-                                    transitionObj.fire(),
-                                    self.done.inc()       
-                                ),
-                            )  
-            sigIfRising.append(True,
-                If(self.done == 0)(
-                    Strobe(f"No transitions related to {signal}+ are enabled"),
-                    self.errVar.eq(True)
-                ),  
-                If(self.done > 1)(
-                    Strobe(f"More than one transition fires for {signal}+"),
-                    self.errVar.eq(True)
-                )  
-            )
-            sigIfFalling.append(True,
-                If(self.done == 0)(
-                    Strobe(f"No transitions related to {signal}- are enabled"),
-                    self.errVar.eq(True)
-                ),
-                If(self.done > 1)(
-                    Strobe(f"More than one transition fires for {signal}-"),
-                    self.errVar.eq(True)
-                )  
             )
         
+        # Every edge keeps its guards, so an unexpected input edge is still
+        # reported. The firing loop is only emitted if something can fire in it
         if len(cmdOut) > 0: 
             self.mod.analog(
-                If(self.rst.read() & 
-                   (Branch(self.vdd, self.gnd).v > 0.05))(
-                    self.done.eq(0),
+                If(rstGuard)(
+                    self.doneClear,
                     self.iter.eq(0),
                     While(~Bool(self.done))(
                         self.iter.inc(),
                         self.done.eq(1),
-                        cmdOut,
+                        CmdList(*cmdOut),
                         If(self.iter > 500)(
                             Fatal(("STG seems to be stuck in a infinite loop "
                                    "of dummy, internal or output transitions.")) 
@@ -724,6 +766,85 @@ class STG():
         if seeError:
             self.mod.analog(self.errorPin.write(self.errVar))
                        
+    #---------------------------------------------------------------------------
+    ## build the transitions of a signal driven by the stg (output or internal)
+    #  
+    #  @param self The object pointer.
+    #  @param signal name of the signal
+    #  @param signalObj digital pin of the signal
+    #  @param rising list of commands executed on the rising edge of the signal
+    #  @param falling list of commands executed on the falling edge of the 
+    #         signal
+    #  @param cmdOut list of commands that fire the enabled transitions
+    #
+    #---------------------------------------------------------------------------
+    def buildOutput(self, signal, signalObj, rising, falling, cmdOut):
+        edgeMap   = self.transitions[signal]
+        state     = signalObj.getST()
+        writeHigh = signalObj.write(True)
+        writeLow  = signalObj.write(False)
+        toggle    = signalObj.toggle()
+        for edge, (onRising, onFalling) in _EDGE_SIDES.items():
+            for transition, transitionObj in edgeMap.get(edge, {}).items():
+                complete = If(transitionObj.isOnGoing())(
+                               transitionObj.putTokens(), 
+                               self.doneInc       
+                           )
+                if onRising:
+                    rising.append(complete)
+                if onFalling:
+                    falling.append(complete)
+                if edge == '+':
+                    action = If(state)(
+                                 Strobe((f"{transition} failed to trigger "
+                                         f"because {signal} is already "
+                                          "high")),
+                                 self.errVar.eq(True)
+                             ).Else(
+                                 writeHigh
+                             )
+                elif edge == '-':
+                    action = If(state)(
+                                 writeLow
+                             ).Else(
+                                 Strobe((f"{transition} failed to trigger "
+                                         f"because {signal} is already "
+                                          "low")),
+                                 self.errVar.eq(True)
+                             )
+                else:
+                    action = toggle
+                cmdOut.append(
+                    If(transitionObj.isEnabled())( 
+                        transitionObj.getTokens(),
+                        action,
+                        self.doneClear
+                    )  
+                )
+
+    #---------------------------------------------------------------------------
+    ## build the transitions of a signal driven by the environment (input)
+    #  
+    #  @param self The object pointer.
+    #  @param signal name of the signal
+    #  @param rising list of commands executed on the rising edge of the signal
+    #  @param falling list of commands executed on the falling edge of the 
+    #         signal
+    #
+    #---------------------------------------------------------------------------
+    def buildInput(self, signal, rising, falling):
+        edgeMap = self.transitions[signal]
+        for edge, (onRising, onFalling) in _EDGE_SIDES.items():
+            for transitionObj in edgeMap.get(edge, {}).values():
+                fire = If(transitionObj.isEnabled())(
+                           transitionObj.fire(), 
+                           self.doneInc       
+                       )
+                if onRising:
+                    rising.append(fire)
+                if onFalling:
+                    falling.append(fire)
+
     #---------------------------------------------------------------------------
     ## match a place with an specific name   
     #  
@@ -732,65 +853,60 @@ class STG():
     #
     #---------------------------------------------------------------------------                
     def matchPlace(self, name):
-        if name in self.places:
-            P = self.places[name]
-        else:
-            marking  = 0
-            capacity = 1
-            if name in self.markings.keys():
-                marking = self.markings[name]
-            if name in self.capacity.keys():
-                capacity = self.capacity[name]
-            var = self.mod.var(value = marking, 
-                               name = f"P_{name}".replace(",", "$$").\
-                                                  replace("+", "$p").\
-                                                  replace("-", "$m").\
-                                                  replace("/", "$"))
-            self.rstAt.append(var.eq(marking))
-            P = Place(var,
-                      self.errVar,
-                      name,
-                      capacity)
-            self.places[name] = P 
+        P = self.places.get(name)
+        if P is not None:
+            return P
+        marking  = self.markings.get(name, 0)
+        capacity = self.capacity.get(name, 1)
+        var = self.mod.var(value = marking, 
+                           name = f"P_{name}".translate(_VAR_NAME))
+        self.rstAt.append(var.eq(marking))
+        P = Place(var,
+                  self.errVar,
+                  name,
+                  capacity)
+        self.places[name] = P 
         return P 
         
     #---------------------------------------------------------------------------
-    ## match a place or a transition with an specific name   
+    ## match a place or a transition with an specific name. Names repeat 
+    #  across arrows, so the result is cached by name and the transition 
+    #  tables are only written the first time a name is seen
     #  
     #  @param self The object pointer.
     #  @return the place or the transition
     #
     #--------------------------------------------------------------------------- 
     def matchTP(self, name):
-        pattern = '([a-zA-Z_][a-zA-Z_0-9.]*)([+-~]?)(/[0-9]*)?'
-        m = re.findall(pattern, name)
-        if len(m) != 0:
-            signame = m[0][0]
-            sigEdge = m[0][1]
-            if signame in self.signals:
-                if name in self.transitions[signame][sigEdge]:
-                    TP = self.transitions[signame][sigEdge][name]
-                else:
-                    if not isinstance(self.signals[signame], hilevelmod.DigIn):
-                        var = self.mod.var(value = False,
-                                           name = f"T_{name}".replace("/", "$").\
-                                                              replace("+", "$p").\
-                                                              replace("-", "$m"))
-                        self.rstAt.append(var.eq(False))
-                        TP = Transition(var)
-                    else:
-                        TP = Transition(None)
-                    self.transitions[signame][sigEdge][name] = TP 
-            elif signame in self.dummies:
-                if name in self.transitions[signame]:
-                    TP = self.transitions[signame][name]
-                else:
-                    TP = Transition(None)
-                    self.transitions[signame][name] = TP
+        TP = self.tpCache.get(name)
+        if TP is not None:
+            return TP
+        # The parser already validated the name, so it is a signal or place 
+        # name, optionally followed by an edge and by an /index
+        signame = name.partition('/')[0]
+        sigEdge = signame[-1]
+        if sigEdge in _EDGE_SIDES:
+            signame = signame[:-1]
+        else:
+            sigEdge = ''
+        if signame in self.signals:
+            if not sigEdge in _EDGE_SIDES:
+                raise ValueError(f"Transition {name} of signal {signame} "
+                                 "has no edge")
+            if not signame in self.inputs:
+                var = self.mod.var(value = False,
+                                   name = f"T_{name}".translate(_VAR_NAME))
+                self.rstAt.append(var.eq(False))
+                TP = Transition(var)
             else:
-                TP = self.matchPlace(name)
+                TP = Transition(None)
+            self.transitions[signame][sigEdge][name] = TP 
+        elif signame in self.dummies:
+            TP = Transition(None)
+            self.transitions[signame][name] = TP
         else:
-            raise Error("Something went wrong")
+            TP = self.matchPlace(name)
+        self.tpCache[name] = TP
         return TP
         
     #---------------------------------------------------------------------------
@@ -804,6 +920,27 @@ class STG():
         return self.mod.getVA()
 
 
+#-------------------------------------------------------------------------------
+## Kind each signal section is converted to, indexed by the cli options 
+#  (seeInternals, allInputs)
+#
+#-------------------------------------------------------------------------------
+_SIGNAL_MAPS = {
+    (False, False) : {"input"    : "input",
+                      "output"   : "output",
+                      "internal" : "internal"},
+    (True,  False) : {"input"    : "input",
+                      "output"   : "output",
+                      "internal" : "output"},
+    (False, True)  : {"input"    : "input",
+                      "output"   : "input",
+                      "internal" : "internal"},
+    (True,  True)  : {"input"    : "input",
+                      "output"   : "input",
+                      "internal" : "input"}
+}
+
+
 #-------------------------------------------------------------------------------
 ## cli
 #
@@ -811,8 +948,10 @@ class STG():
 def cli():
 
     #---------------------------------------------------------------------------
-    # Input arguments
+    # Input arguments. argparse is only needed here, so importing the module
+    # for parseSTG or STG does not load it
     #---------------------------------------------------------------------------
+    import argparse
     parser = argparse.ArgumentParser()
     parser.add_argument(
         'stg', 
@@ -877,32 +1016,26 @@ def cli():
     # Open stg file
     #---------------------------------------------------------------------------
     try:
-        #Open stg file
-        with open(results.stg[0]) as content_file:
-            content = content_file.read()
-        #Create stg
-        model = compile(GRAMMAR)
-        ast = model.parse(content)
-        mapping = {"input"    : "input", 
-                   "output"   : "output",
-                   "internal" : "internal"}
-                            
-        if results.seeInt and (not results.allInp):
-            mapping["internal"] = "output"
-        elif results.seeInt and results.allInp:
-            mapping["internal"] = "input"
-        if results.allInp:
-            mapping["output"] = "input"
+        #Open and parse stg file. The file is parsed while it is read, one
+        #line at a time
+        with open(results.stg[0], encoding = "utf-8") as stgFile:
+            ast = parseSTG(stgFile)
+        mapping = dict(_SIGNAL_MAPS[(results.seeInt, results.allInp)])
 
+        #Create stg. The ast is not needed once the model is built
         stg = STG(ast, mapping, results.vdd, results.vss, results.rst, results.seeError)
+        del ast
         
-        #Open log file
-        f = open(results.outFile, "w")
-        f.write(stg.getVA())
-        f.close()
-    except Exception as e:
-        raise e
-        print("Error: " + str(e))
+        #Write the verilogA. The model is rendered once, so it goes out in a 
+        #single write
+        with open(results.outFile, "w") as va_file:
+            va_file.write(stg.getVA())
+    except (OSError, ValueError, VagenError) as e:
+        # Syntax errors and inconsistent stgs raise ValueError (so does a 
+        # file that cannot be decoded). vagen rejects names that clash, e.g.
+        # a signal called RST or -vdd set to a signal. Anything else is a 
+        # bug and keeps its traceback
+        print(f"Error: {e}", file = stderr)
         exit(-1)
 
     #---------------------------------------------------------------------------
@@ -28,7 +28,7 @@
 #    
 ################################################################################
 
-from vagen import *
+from vagen import HiLevelMod, Cross, While, WaitUs
 
 #Create a module     
 mod  = HiLevelMod("STG2VA_TB")
@@ -46,39 +46,36 @@ evnt2 = Cross(out2.diffHalfDomain, "both")
 evnt3 = Cross(out3.diffHalfDomain, "both")
 evnt4 = Cross(out4.diffHalfDomain, "both")
 
+#Stimulus pattern. Each step writes the inputs and waits for the given time
+#in us
+pattern = [
+    ([(in1, True)],                7),
+    ([(in1, False)],               3),
+    ([(in1, True)],                3),
+    ([(in2, True)],                3),
+    ([(in1, False), (in2, False)], 3),
+    ([(in2, True)],                7),
+    ([(in2, False)],               3),
+    ([(in2, True)],                3),
+    ([(in1, True)],                3),
+    ([(in1, False), (in2, False)], 3)
+]
+
+#Build the steps of the pattern
+steps = []
+for writes, delay in pattern:
+    steps.extend(sig.write(value) for sig, value in writes)
+    steps.append(WaitUs(delay))
+
 #First test sequence
 mod.seq(True)(
     WaitUs(1),
     rst.write(True),
     WaitUs(1),
-    While(True)(
-        in1.write(True),
-        WaitUs(7),
-        in1.write(False),
-        WaitUs(3),
-        in1.write(True),
-        WaitUs(3),
-        in2.write(True),
-        WaitUs(3),
-        in1.write(False),
-        in2.write(False),
-        WaitUs(3),
-        in2.write(True),
-        WaitUs(7),
-        in2.write(False),
-        WaitUs(3),
-        in2.write(True),
-        WaitUs(3),
-        in1.write(True),
-        WaitUs(3),
-        in1.write(False),
-        in2.write(False),
-        WaitUs(3)
-    ) 
+    While(True)(*steps)
 )
 
 #Save veriloga file
-file = open('veriloga.va', 'w')
-file.write(mod.getVA())
-file.close()
+with open('veriloga.va', 'w') as file:
+    file.write(mod.getVA())
 
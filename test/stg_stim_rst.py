@@ -28,7 +28,7 @@
 #    
 ################################################################################
 
-from vagen import *
+from vagen import HiLevelMod, While, WaitUs
 
 #Create a module     
 mod  = HiLevelMod("STG2VA_TB")
@@ -75,7 +75,6 @@ mod.seq(True)(
 )
 
 #Save veriloga file
-file = open('veriloga.va', 'w')
-file.write(mod.getVA())
-file.close()
+with open('veriloga.va', 'w') as file:
+    file.write(mod.getVA())
 
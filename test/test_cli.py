@@ -0,0 +1,82 @@
+################################################################################
+#  @file test_cli.py
+#  Checks that malformed stgs are reported as errors by the command line tool
+# 
+#  @author  Rodrigo Pedroso Mendes
+#  @version V1.0
+#
+#  #LICENSE# 
+#    
+#  Copyright (c) 2023 Rodrigo Pedroso Mendes
+#
+#  Permission is hereby granted, free of charge, to any  person   obtaining  a 
+#  copy of this software and associated  documentation files (the "Software"), 
+#  to deal in the Software without restriction, including  without  limitation 
+#  the rights to use, copy, modify,  merge,  publish,  distribute, sublicense, 
+#  and/or sell copies of the Software, and  to  permit  persons  to  whom  the 
+#  Software is furnished to do so, subject to the following conditions:        
+#   
+#  The above copyright notice and this permission notice shall be included  in 
+#  all copies or substantial portions of the Software.                         
+#   
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,  EXPRESS OR 
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE  WARRANTIES  OF  MERCHANTABILITY, 
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+#  AUTHORS OR COPYRIGHT HOLDERS BE  LIABLE FOR ANY  CLAIM,  DAMAGES  OR  OTHER 
+#  LIABILITY, WHETHER IN AN ACTION OF  CONTRACT, TORT  OR  OTHERWISE,  ARISING 
+#  FROM, OUT OF OR IN CONNECTION  WITH  THE  SOFTWARE  OR  THE  USE  OR  OTHER  
+#  DEALINGS IN THE SOFTWARE. 
+#    
+################################################################################
+
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+_SCRIPT = Path(__file__).resolve().parent.parent/"stg2veriloga"/"stg2veriloga.py"
+
+
+#-------------------------------------------------------------------------------
+## Runs stg2veriloga under python -O, so asserts are stripped, over an stg
+#  with the given content.
+#
+#  @param content content of the .g file
+#  @return the completed process
+#
+#-------------------------------------------------------------------------------
+def runOptimized(content):
+    with tempfile.TemporaryDirectory() as tmp:
+        stg = Path(tmp)/"bad.g"
+        stg.write_text(content, encoding = "utf-8")
+        return subprocess.run([sys.executable, "-O", str(_SCRIPT), str(stg),
+                               "-o", str(Path(tmp)/"bad.va")],
+                              capture_output = True, text = True)
+
+
+class TestBadStg(unittest.TestCase):
+
+    def assertFails(self, content, message):
+        result = runOptimized(content)
+        self.assertNotEqual(result.returncode, 0)
+        self.assertIn(message, result.stdout + result.stderr)
+
+    def test_transition_without_edge(self):
+        self.assertFails(".model bad\n.inputs a\n.outputs x\n.graph\n"
+                         "a+ x\nx a-\n.marking {<a-,a+>}\n.end\n",
+                         "Transition x of signal x has no edge")
+
+    def test_duplicated_signal(self):
+        self.assertFails(".model bad\n.inputs a\n.outputs a\n.graph\n"
+                         "a+ a-\n.end\n",
+                         "Duplicated signal a")
+
+    def test_arrow_between_places(self):
+        self.assertFails(".model bad\n.inputs a\n.graph\np0 p1\np1 a+\n"
+                         "a+ a-\na- p0\n.marking {p0}\n.end\n",
+                         "There can't be arrow from place p0 to place p1")
+
+
+if __name__ == "__main__":
+    unittest.main()